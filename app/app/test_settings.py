@@ -0,0 +1,10 @@
+"""
+Django settings for running the tests.
+"""
+from app.settings import *  # noqa: F401,F403
+
+# Tests never need a strong password hash, a fast hasher makes
+# creating users in the tests much cheaper
+PASSWORD_HASHERS = [
+    'django.contrib.auth.hashers.MD5PasswordHasher',
+]
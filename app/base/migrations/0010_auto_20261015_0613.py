@@ -0,0 +1,33 @@
+# Generated by Django 3.2.25 on 2026-10-15 06:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0009_perfume_image'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='perfume',
+            name='longevity',
+            field=models.FloatField(),
+        ),
+        migrations.AlterField(
+            model_name='perfume',
+            name='price_value',
+            field=models.FloatField(),
+        ),
+        migrations.AlterField(
+            model_name='perfume',
+            name='rating',
+            field=models.FloatField(),
+        ),
+        migrations.AlterField(
+            model_name='perfume',
+            name='sillage',
+            field=models.FloatField(),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 3.2.25 on 2026-10-15 06:13
+
+from django.db import migrations
+
+
+def merge_duplicates(model, through, fk_name, key_fields):
+    """Keep the oldest row for every key and move its links to it."""
+    keep = {}
+    for obj in model.objects.order_by('id'):
+        key = tuple(getattr(obj, field) for field in key_fields)
+        keep.setdefault(key, obj.id)
+        if keep[key] == obj.id:
+            continue
+
+        # Re-point links that are not already on the kept row
+        linked = through.objects.filter(**{fk_name: keep[key]}).values_list(
+            'perfume_id', flat=True,
+        )
+        links = through.objects.filter(**{fk_name: obj.id})
+        links.exclude(perfume_id__in=linked).update(**{fk_name: keep[key]})
+        obj.delete()
+
+
+def dedupe_designers_notes(apps, schema_editor):
+    Perfume = apps.get_model('base', 'Perfume')
+    merge_duplicates(
+        apps.get_model('base', 'Designer'),
+        Perfume.designers.through,
+        'designer_id',
+        ['name'],
+    )
+    merge_duplicates(
+        apps.get_model('base', 'Note'),
+        Perfume.notes.through,
+        'note_id',
+        ['name', 'type'],
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0010_auto_20261015_0613'),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_designers_notes,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.25 on 2026-10-15 06:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0011_dedupe_designers_notes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='designer',
+            name='name',
+            field=models.CharField(max_length=255, unique=True),
+        ),
+        migrations.AddConstraint(
+            model_name='note',
+            constraint=models.UniqueConstraint(fields=('name', 'type'), name='uniq_note_name_type'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-15 06:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0012_unique_designer_note'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='perfume',
+            name='image_thumb_url',
+            field=models.CharField(blank=True, max_length=512),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-15 06:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0013_perfume_image_thumb_url'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='perfume',
+            index=models.Index(fields=['user', '-id'], name='perfume_user_id_desc_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-15 06:27
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0014_perfume_user_id_desc_idx'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='designer',
+            options={'ordering': ['-name']},
+        ),
+        migrations.AlterModelOptions(
+            name='note',
+            options={'ordering': ['-name']},
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.2.25 on 2026-10-15 06:37
+
+import base.models
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0015_designer_note_ordering'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='perfume',
+            name='longevity',
+            field=models.FloatField(validators=[base.models.validate_finite, django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(99.99)]),
+        ),
+        migrations.AlterField(
+            model_name='perfume',
+            name='price_value',
+            field=models.FloatField(validators=[base.models.validate_finite, django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(99.99)]),
+        ),
+        migrations.AlterField(
+            model_name='perfume',
+            name='rating',
+            field=models.FloatField(validators=[base.models.validate_finite, django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(99.99)]),
+        ),
+        migrations.AlterField(
+            model_name='perfume',
+            name='sillage',
+            field=models.FloatField(validators=[base.models.validate_finite, django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(99.99)]),
+        ),
+    ]
@@ -1,17 +1,48 @@
 """
 Database models.
 """
-from django.db import models
+from django.contrib.postgres.aggregates import JSONBAgg
+from django.db import models, transaction
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import JSONObject
 from django.contrib.auth.models import (
     AbstractBaseUser,
     BaseUserManager,
     PermissionsMixin,
 )
+from django.contrib.auth.hashers import get_hasher, make_password
 from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.validators import MaxValueValidator, MinValueValidator
 
+from PIL import Image
+
+import io
+import math
 import uuid
 import os
 
+# Maximum width and height of perfume image thumbnails
+THUMBNAIL_SIZE = (200, 200)
+
+
+def validate_finite(value):
+    """Reject NaN and infinity.
+    NaN is neither smaller nor bigger than anything,
+    so min/max validators let it through.
+    """
+    if not math.isfinite(value):
+        raise ValidationError('Ensure this value is a finite number.')
+
+
+# Range of the Decimal(4, 2) columns these fields used to be
+SCORE_VALIDATORS = [
+    validate_finite,
+    MinValueValidator(0),
+    MaxValueValidator(99.99),
+]
+
 
 def perfume_image_file_path(instance, filename):
     """Generate file path for new perfume image."""
@@ -24,9 +55,32 @@ def perfume_image_file_path(instance, filename):
     return os.path.join('uploads', 'perfume', filename)
 
 
+def perfume_thumbnail_file_path(image_name):
+    """Generate file path for the thumbnail of a perfume image.
+    Thumbnails are always JPEG, whatever the original format.
+    """
+    root = os.path.splitext(image_name)[0]
+    return f'{root}_thumb.jpg'
+
+
 class UserManager(BaseUserManager):
     """Manager for users."""
 
+    @classmethod
+    def normalize_email(cls, email):
+        """Strip whitespace and lowercase the domain part of the email.
+        Most addresses already have a lowercase domain,
+        in that case the stripped email is returned as it is.
+        """
+        email = (email or '').strip()
+        at = email.rfind('@')
+        if at == -1:
+            return email
+        domain = email[at + 1:]
+        if domain.islower():
+            return email
+        return email[:at + 1] + domain.lower()
+
     def create_user(self, email, password=None, **extra_fields):
         """Create, save and return a new user.
 
@@ -48,21 +102,51 @@ class UserManager(BaseUserManager):
         user = self.model(email=self.normalize_email(email), **extra_fields)
         # It will take the password provided in the create user method
         # and encrypt through a hashing mechanism.
-        user.set_password(password)
+        if password is None:
+            user.set_unusable_password()
+        else:
+            user.set_password(password)
         # using=self._db --> allow us to add multiple databases,
         # although it is rarely used
         user.save(using=self._db)
 
         return user
 
-    def create_superuser(self, email, password):
-        """ Create and return a new superuser. """
-        user = self.create_user(email, password)
-        user.is_staff = True
-        user.is_superuser = True
-        user.save(using=self._db)
+    def bulk_create_users(self, rows, batch_size=500):
+        """Create and return many users with one INSERT per batch.
+        Every row is a dict with an email and optionally a password
+        and any other user fields, like the create_user() arguments.
+        Useful for seeding data, create_user() stays the way to
+        create a single user.
+        """
+        hasher = get_hasher('default')
+        users = []
+        for row in rows:
+            fields = dict(row)
+            email = fields.pop('email', None)
+            if not email:
+                raise ValueError("User must have an email address.")
+            password = fields.pop('password', None)
+            users.append(self.model(
+                email=self.normalize_email(email),
+                password=make_password(password, hasher=hasher),
+                **fields,
+            ))
 
-        return user
+        return self.bulk_create(users, batch_size=batch_size)
+
+    @transaction.atomic
+    def create_superuser(self, email, password):
+        """ Create and return a new superuser.
+        Staff flags are passed as extra fields so the user
+        is saved only once.
+        """
+        return self.create_user(
+            email,
+            password,
+            is_staff=True,
+            is_superuser=True,
+        )
 
 
 class User(AbstractBaseUser, PermissionsMixin):
@@ -87,18 +171,66 @@ class Note(models.Model):
     name = models.CharField(max_length=255)
     type = models.IntegerField()
 
+    class Meta:
+        # The (name, type) unique index also serves this ordering
+        ordering = ['-name']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'type'],
+                name='uniq_note_name_type',
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
 
 class Designer(models.Model):
     """Designer object"""
-    name = models.CharField(max_length=255)
+    name = models.CharField(max_length=255, unique=True)
+
+    class Meta:
+        # Read backwards from the unique index on name
+        ordering = ['-name']
 
     def __str__(self):
         return self.name
 
 
+def related_json(through, target, fields):
+    """Return a subquery aggregating the rows of a perfume relation
+    into a JSON list of objects with the given fields.
+    Rows follow the default ordering of designers and notes.
+    """
+    row = JSONObject(**{field: f'{target}__{field}' for field in fields})
+    return Subquery(
+        through.objects
+        .filter(perfume_id=OuterRef('pk'))
+        .values('perfume_id')
+        .annotate(data=JSONBAgg(row, ordering=f'-{target}__name'))
+        .values('data')
+    )
+
+
+class PerfumeQuerySet(models.QuerySet):
+    """Custom queryset for perfumes."""
+
+    def with_nested_json(self):
+        """Annotate designers_json and notes_json.
+        Postgres builds the nested lists in the same query,
+        so no Designer or Note objects have to be loaded.
+        Perfumes without designers/notes get None.
+        """
+        return self.annotate(
+            designers_json=related_json(
+                self.model.designers.through, 'designer', ['id', 'name'],
+            ),
+            notes_json=related_json(
+                self.model.notes.through, 'note', ['id', 'name', 'type'],
+            ),
+        )
+
+
 class Perfume(models.Model):
     """Recipe object."""
     user = models.ForeignKey(
@@ -111,14 +243,51 @@ class Perfume(models.Model):
     notes = models.ManyToManyField('Note')
     designers = models.ManyToManyField('Designer')
     title = models.CharField(max_length=255)
-    rating = models.DecimalField(max_digits=4, decimal_places=2)
+    rating = models.FloatField(validators=SCORE_VALIDATORS)
     number_of_votes = models.IntegerField()
     gender = models.IntegerField()
-    longevity = models.DecimalField(max_digits=4, decimal_places=2)
-    sillage = models.DecimalField(max_digits=4, decimal_places=2)
-    price_value = models.DecimalField(max_digits=4, decimal_places=2)
+    longevity = models.FloatField(validators=SCORE_VALIDATORS)
+    sillage = models.FloatField(validators=SCORE_VALIDATORS)
+    price_value = models.FloatField(validators=SCORE_VALIDATORS)
     description = models.TextField(blank=True)
     image = models.ImageField(null=True, upload_to=perfume_image_file_path)
+    image_thumb_url = models.CharField(max_length=512, blank=True)
+
+    objects = PerfumeQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Matches the list query: filter by user, newest first
+            models.Index(fields=['user', '-id'],
+                         name='perfume_user_id_desc_idx'),
+        ]
 
     def __str__(self):
         return self.title
+
+    def generate_thumbnail(self):
+        """Store a small copy of the image and remember its URL.
+        The URL is computed once per upload, so lists don't have
+        to build (or sign, on cloud storage) an image URL per row.
+        """
+        storage = self.image.storage
+        # Image.open() doesn't close files passed to it
+        with self.image.open('rb') as image_file, \
+                Image.open(image_file) as img:
+            img.thumbnail(THUMBNAIL_SIZE)
+            # Pillow can read formats it can't write (PSD...),
+            # so the thumbnail is stored in a fixed format
+            thumb = img.convert('RGB')
+            buffer = io.BytesIO()
+            thumb.save(buffer, format='JPEG')
+
+        path = storage.save(
+            perfume_thumbnail_file_path(self.image.name),
+            ContentFile(buffer.getvalue()),
+        )
+        self.image_thumb_url = storage.url(path)
+
+    def delete_thumbnail(self, image_name):
+        """Delete the thumbnail made for a previous image."""
+        if image_name and image_name != self.image.name:
+            self.image.storage.delete(perfume_thumbnail_file_path(image_name))
@@ -1,10 +1,10 @@
 """
 Tests for models.
 """
+from django.db import IntegrityError
 from django.test import TestCase
 from django.contrib.auth import get_user_model
 from base import models
-from decimal import Decimal
 from unittest.mock import patch
 
 """
@@ -47,15 +47,57 @@ class ModelTests(TestCase):
             ['TEST3@EXAMPLE.com', 'TEST3@example.com'],
             ['test4@example.COM', 'test4@example.com'],
         ]
+        # Normalization is pure Python, no need to save a user per email
         for email, expected in sample_emails:
-            user = get_user_model().objects.create_user(email, 'sample123')
-            self.assertEqual(user.email, expected)
+            self.assertEqual(
+                get_user_model().objects.normalize_email(email),
+                expected,
+            )
+
+        # create_user() has to store the normalized email
+        user = get_user_model().objects.create_user(
+            sample_emails[0][0],
+            'sample123',
+        )
+        self.assertEqual(user.email, sample_emails[0][1])
+
+    def test_new_user_email_whitespace_stripped(self):
+        """Test whitespace around the email is removed."""
+        for email in [' test@EXAMPLE.com ', 'test@example.COM\n']:
+            self.assertEqual(
+                get_user_model().objects.normalize_email(email),
+                'test@example.com',
+            )
+
+    def test_create_user_without_password(self):
+        """Test a user created without password can not log in."""
+        user = get_user_model().objects.create_user('test@example.com')
+
+        self.assertFalse(user.has_usable_password())
 
     def test_new_user_without_email_raises_error(self):
         """Test that creating a user without an email raises a ValueError."""
         with self.assertRaises(ValueError):
             get_user_model().objects.create_user('', 'test123')
 
+    def test_bulk_create_users(self):
+        """Test creating many users at once."""
+        users = get_user_model().objects.bulk_create_users([
+            {'email': 'test1@EXAMPLE.com', 'password': 'testpass123'},
+            {'email': 'test2@example.com', 'name': 'Test Name'},
+        ])
+
+        self.assertEqual(get_user_model().objects.count(), 2)
+        self.assertEqual(users[0].email, 'test1@example.com')
+        self.assertTrue(users[0].check_password('testpass123'))
+        self.assertEqual(users[1].name, 'Test Name')
+        self.assertFalse(users[1].has_usable_password())
+
+    def test_bulk_create_users_without_email_raises_error(self):
+        """Test every bulk created user needs an email."""
+        with self.assertRaises(ValueError):
+            get_user_model().objects.bulk_create_users([{'email': ''}])
+
     def test_create_superuser(self):
         """Test creating a superuser."""
         user = get_user_model().objects.create_superuser(
@@ -91,12 +133,12 @@ class ModelTests(TestCase):
         perfume = models.Perfume.objects.create(
             user=user,
             title='Sample perfume name',
-            rating=Decimal('5.50'),
+            rating=5.5,
             number_of_votes=2500,
             gender=0,
-            longevity=Decimal('6.1'),
-            sillage=Decimal('4.2'),
-            price_value=Decimal('7.0'),
+            longevity=6.1,
+            sillage=4.2,
+            price_value=7.0,
             description="Perfume description.",
         )
 
@@ -109,6 +151,12 @@ class ModelTests(TestCase):
         designer = models.Designer.objects.create(name='Christian Dior')
         self.assertEqual(str(designer), designer.name)
 
+    def test_designer_name_unique(self):
+        """Test designer names are unique."""
+        models.Designer.objects.create(name='Christian Dior')
+        with self.assertRaises(IntegrityError):
+            models.Designer.objects.create(name='Christian Dior')
+
     def test_create_note(self):
         """Test creating a note is successful."""
         note = models.Note.objects.create(
@@ -118,6 +166,13 @@ class ModelTests(TestCase):
 
         self.assertEqual(str(note), note.name)
 
+    def test_note_name_type_unique(self):
+        """Test a note name can be reused only with a different type."""
+        models.Note.objects.create(name='Patchouli', type=0)
+        models.Note.objects.create(name='Patchouli', type=1)
+        with self.assertRaises(IntegrityError):
+            models.Note.objects.create(name='Patchouli', type=0)
+
     @patch('base.models.uuid.uuid4')
     def test_perfume_file_name_uuid(self, mock_uuid):
         """Test generating image path."""
@@ -126,3 +181,11 @@ class ModelTests(TestCase):
         file_path = models.perfume_image_file_path(None, 'example.jpg')
 
         self.assertEqual(file_path, f'uploads/perfume/{uuid}.jpg')
+
+    def test_perfume_thumbnail_file_name(self):
+        """Test generating thumbnail path next to the image."""
+        file_path = models.perfume_thumbnail_file_path(
+            'uploads/perfume/test-uuid.jpg',
+        )
+
+        self.assertEqual(file_path, 'uploads/perfume/test-uuid_thumb.jpg')
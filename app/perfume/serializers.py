@@ -1,30 +1,102 @@
 """
 Serializers for recipe APIs
 """
+import copy
+from collections import OrderedDict
+
+from django.db import transaction
 from rest_framework import serializers
 
 from base.models import Perfume, Designer, Note
 
+# Number of rows sent per INSERT when bulk creating designers/notes
+BULK_CREATE_BATCH_SIZE = 500
 
-class DesignerSerializer(serializers.ModelSerializer):
-    """Serializer for designers. """
 
-    class Meta:
-        model = Designer
-        fields = ['id', 'name']
-        read_only_field = ['id']
+class CachedFieldsMixin:
+    """Build the fields of a ModelSerializer once per class.
+    ModelSerializer.get_fields() inspects the model every time
+    a serializer is created, but the result only depends on the
+    class. Fields get bound to their serializer, so every
+    instance receives its own deep copy of the cached fields.
+    """
+
+    def get_fields(self):
+        cls = type(self)
+        # Look in the class itself, subclasses have other fields
+        if '_cached_fields' not in cls.__dict__:
+            cls._cached_fields = super().get_fields()
+        return copy.deepcopy(cls._cached_fields)
+
+
+# A plain Serializer instead of ModelSerializer, designers are
+# rendered for every perfume in a list so we skip the model
+# introspection and build the output dict directly.
+class DesignerSerializer(serializers.Serializer):
+    """Serializer for designers."""
+    id = serializers.IntegerField(read_only=True)
+    name = serializers.CharField(max_length=255)
+
+    def to_representation(self, instance):
+        return {'id': instance.id, 'name': instance.name}
+
+    def validate_name(self, value):
+        """Reject renaming to a name used by another designer.
+        Nested designers on a perfume (parent is set) are matched
+        by name instead, so they are allowed to exist.
+        """
+        if self.parent is None:
+            others = Designer.objects.filter(name=value)
+            if self.instance is not None:
+                others = others.exclude(pk=self.instance.pk)
+            if others.exists():
+                raise serializers.ValidationError(
+                    'Designer with this name already exists.')
+        return value
+
+    def update(self, instance, validated_data):
+        """Update and return designer."""
+        instance.name = validated_data.get('name', instance.name)
+        instance.save()
+        return instance
 
 
-class NoteSerializer(serializers.ModelSerializer):
+class NoteSerializer(serializers.Serializer):
     """Serializer for notes."""
+    id = serializers.IntegerField(read_only=True)
+    name = serializers.CharField(max_length=255)
+    type = serializers.IntegerField()
 
-    class Meta:
-        model = Note
-        fields = ['id', 'name', 'type']
-        read_only_fields = ['id']
+    def to_representation(self, instance):
+        return {
+            'id': instance.id,
+            'name': instance.name,
+            'type': instance.type,
+        }
+
+    def validate(self, attrs):
+        """Reject changing a note into an existing (name, type) pair."""
+        if self.parent is None and self.instance is not None:
+            name = attrs.get('name', self.instance.name)
+            type_ = attrs.get('type', self.instance.type)
+            others = Note.objects.filter(name=name, type=type_).exclude(
+                pk=self.instance.pk,
+            )
+            if others.exists():
+                raise serializers.ValidationError(
+                    'Note with this name and type already exists.')
+        return attrs
+
+    def update(self, instance, validated_data):
+        """Update and return note."""
+        instance.name = validated_data.get('name', instance.name)
+        instance.type = validated_data.get('type', instance.type)
+        instance.save()
+        return instance
 
 
-class PerfumeImageSerializer(serializers.ModelSerializer):
+class PerfumeImageSerializer(CachedFieldsMixin,
+                             serializers.ModelSerializer):
     """Serializer for uploading images to perfumes."""
 
     class Meta:
@@ -33,8 +105,17 @@ class PerfumeImageSerializer(serializers.ModelSerializer):
         read_only_fields = ['id']
         extra_kwargs = {'image': {'required': 'True'}}
 
+    def update(self, instance, validated_data):
+        """Save the image and generate its thumbnail."""
+        old_image = instance.image.name
+        instance = super().update(instance, validated_data)
+        instance.generate_thumbnail()
+        instance.save(update_fields=['image_thumb_url'])
+        instance.delete_thumbnail(old_image)
+        return instance
+
 
-class PerfumeSerializer(serializers.ModelSerializer):
+class PerfumeSerializer(CachedFieldsMixin, serializers.ModelSerializer):
     """Serializer for perfumes."""
     designers = DesignerSerializer(many=True, required=False)
     notes = NoteSerializer(many=True, required=False)
@@ -42,8 +123,31 @@ class PerfumeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Perfume
         fields = ['id', 'title', 'rating', 'number_of_votes', 'gender',
-                  'longevity', 'sillage', 'price_value', 'designers', 'notes']
-        read_only_fields = ['id']
+                  'longevity', 'sillage', 'price_value', 'designers', 'notes',
+                  'image_thumb_url']
+        read_only_fields = ['id', 'image_thumb_url']
+
+    def to_representation(self, instance):
+        """Return perfume data.
+        When the queryset was annotated with with_nested_json()
+        designers and notes are taken from the JSON built by
+        the database instead of running the nested serializers.
+        """
+        if not hasattr(instance, 'designers_json'):
+            return super().to_representation(instance)
+
+        ret = OrderedDict()
+        for field in self._readable_fields:
+            if field.field_name in ('designers', 'notes'):
+                value = getattr(instance, f'{field.field_name}_json')
+                ret[field.field_name] = value or []
+                continue
+            attribute = field.get_attribute(instance)
+            ret[field.field_name] = (
+                None if attribute is None
+                else field.to_representation(attribute)
+            )
+        return ret
 
 
 class PerfumeDetailSerializer(PerfumeSerializer):
@@ -53,22 +157,76 @@ class PerfumeDetailSerializer(PerfumeSerializer):
         fields = PerfumeSerializer.Meta.fields + ['description', 'image']
 
     @staticmethod
-    def _get_or_create_designers(designers, perfume):
-        """Handle getting or creating designers as needed."""
-        for designer in designers:
-            designer_obj, created = Designer.objects.get_or_create(
-                **designer,
+    def _get_or_create_designers(designers):
+        """Return the designers, creating the missing ones.
+        Instead of one get_or_create() per designer we fetch the
+        existing ones with a single query and bulk insert the rest.
+        Runs inside the transaction opened by create()/update().
+        """
+        # dict.fromkeys() removes duplicates but keeps the order
+        names = list(dict.fromkeys(designer['name']
+                                   for designer in designers))
+        if not names:
+            return []
+
+        existing = {
+            designer.name: designer
+            for designer in Designer.objects.filter(name__in=names)
+        }
+        missing = [Designer(name=name)
+                   for name in names if name not in existing]
+        if missing:
+            Designer.objects.bulk_create(
+                missing,
+                ignore_conflicts=True,
+                batch_size=BULK_CREATE_BATCH_SIZE,
             )
-            perfume.designers.add(designer_obj)
+            # ignore_conflicts=True skips rows inserted concurrently
+            # (name is unique) but it does not set primary keys
+            # on the created objects, so we have to read them back
+            existing.update(
+                (designer.name, designer)
+                for designer in Designer.objects.filter(
+                    name__in=[designer.name for designer in missing],
+                )
+            )
+
+        return [existing[name] for name in names]
 
     @staticmethod
-    def _get_or_create_notes(notes, perfume):
-        """Handle getting or creating notes as needed."""
-        for note in notes:
-            note_obj, created = Note.objects.get_or_create(
-                **note,
+    def _get_or_create_notes(notes):
+        """Return the notes, creating the missing ones.
+        Notes are identified by the (name, type) pair and are
+        handled the same way as designers.
+        """
+        keys = list(dict.fromkeys((note['name'], note['type'])
+                                  for note in notes))
+        if not keys:
+            return []
+
+        candidates = Note.objects.filter(
+            name__in={name for name, _ in keys},
+            type__in={type_ for _, type_ in keys},
+        )
+        existing = {(note.name, note.type): note for note in candidates}
+        missing = [Note(name=name, type=type_)
+                   for name, type_ in keys
+                   if (name, type_) not in existing]
+        if missing:
+            Note.objects.bulk_create(
+                missing,
+                ignore_conflicts=True,
+                batch_size=BULK_CREATE_BATCH_SIZE,
+            )
+            existing.update(
+                ((note.name, note.type), note)
+                for note in Note.objects.filter(
+                    name__in={note.name for note in missing},
+                    type__in={note.type for note in missing},
+                )
             )
-            perfume.notes.add(note_obj)
+
+        return [existing[key] for key in keys]
 
     def create(self, validated_data):
         """Create a perfume.
@@ -78,9 +236,12 @@ class PerfumeDetailSerializer(PerfumeSerializer):
         # removes designers from validated data and assign's it to variable designers
         designers = validated_data.pop('designers', [])
         notes = validated_data.pop('notes', [])
-        perfume = Perfume.objects.create(**validated_data)
-        self._get_or_create_designers(designers, perfume)
-        self._get_or_create_notes(notes, perfume)
+        # All inserts are committed together
+        with transaction.atomic():
+            perfume = Perfume.objects.create(**validated_data)
+            # add() links all rows with a single INSERT
+            perfume.designers.add(*self._get_or_create_designers(designers))
+            perfume.notes.add(*self._get_or_create_notes(notes))
         return perfume
 
     # instance is the existing data
@@ -89,18 +250,38 @@ class PerfumeDetailSerializer(PerfumeSerializer):
         """Update perfume."""
 
         designers = validated_data.pop('designers', None)
-        if designers is not None:
-            instance.designers.clear()
-            self._get_or_create_designers(designers, instance)
-
         notes = validated_data.pop('notes', None)
-        if notes is not None:
-            instance.notes.clear()
-            self._get_or_create_notes(notes, instance)
+        old_image = instance.image.name
+        with transaction.atomic():
+            # set() only deletes and inserts the links that changed
+            if designers is not None:
+                instance.designers.set(
+                    self._get_or_create_designers(designers),
+                )
 
-        # everything else will be updated
-        for attr, value in validated_data.items():
-            setattr(instance, attr, value)
+            if notes is not None:
+                instance.notes.set(self._get_or_create_notes(notes))
 
-        instance.save()
+            # everything else will be updated
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+
+            if 'image' in validated_data:
+                # The image file has to be stored by save()
+                # before the thumbnail can be made from it
+                instance.save()
+                if instance.image:
+                    instance.generate_thumbnail()
+                else:
+                    instance.image_thumb_url = ''
+                instance.save(update_fields=['image_thumb_url'])
+            elif validated_data:
+                # UPDATE only the columns that were sent
+                # instead of rewriting the whole row
+                Perfume.objects.filter(pk=instance.pk).update(
+                    **validated_data,
+                )
+        # Files aren't rolled back, so delete only after the commit
+        if 'image' in validated_data:
+            instance.delete_thumbnail(old_image)
         return instance
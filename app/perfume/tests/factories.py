@@ -0,0 +1,31 @@
+"""
+Shared helpers to create test data for the perfume tests.
+"""
+from base.models import Perfume
+
+# Built once at import time and shared by every test module
+PERFUME_DEFAULTS = {
+    'title': 'Sample perfume name',
+    'rating': 5.5,
+    'number_of_votes': 2500,
+    'gender': 0,
+    'longevity': 6.1,
+    'sillage': 4.2,
+    'price_value': 7.0,
+    'description': "Perfume description.",
+}
+
+
+def create_perfume(user, **params):
+    """Create and return a record in perfume database.
+    Any params given override the matching PERFUME_DEFAULTS.
+    """
+    return Perfume.objects.create(user=user, **{**PERFUME_DEFAULTS, **params})
+
+
+def create_perfumes(user, count, **params):
+    """Create count perfumes with a single INSERT and return them."""
+    return Perfume.objects.bulk_create([
+        Perfume(user=user, **{**PERFUME_DEFAULTS, **params})
+        for _ in range(count)
+    ])
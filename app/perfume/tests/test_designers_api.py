@@ -1,21 +1,24 @@
 """
 Tests for the designers API.
 """
+from functools import lru_cache
+
 from django.contrib.auth import get_user_model
 from django.urls import reverse
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
 from base.models import Designer, Perfume
 from perfume.serializers import DesignerSerializer
+from perfume.tests.factories import create_perfumes
 
-from decimal import Decimal
-
+User = get_user_model()
 DESIGNERS_URL = reverse('perfume:designer-list')
 
 
+@lru_cache(maxsize=None)
 def detail_url(designer_id):
     """Create and return a designer detail url."""
     return reverse('perfume:designer-detail', args=[designer_id])
@@ -23,14 +26,13 @@ def detail_url(designer_id):
 
 def create_user(email='user@example.com', password='testpass123'):
     """Create and return a user."""
-    return get_user_model().objects.create_user(email=email, password=password)
+    return User.objects.create_user(email=email, password=password)
 
 
-class PublicDesignersApiTests(TestCase):
+class PublicDesignersApiTests(SimpleTestCase):
     """Test unauthenticated API requests."""
-
-    def setUp(self):
-        self.client = APIClient()
+    # The 401 is returned before any query, so no transaction is needed
+    client_class = APIClient
 
     def test_auth_required(self):
         """Test auth is required for retrieving tags."""
@@ -40,24 +42,43 @@ class PublicDesignersApiTests(TestCase):
 
 class PrivateDesignersApiTests(TestCase):
     """Test authenticated API requests."""
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        # Created once for the whole class instead of before every test
+        cls.user = create_user()
+        # Designer1 is assigned to both perfumes, Designer2 to none
+        cls.designer1, cls.designer2 = Designer.objects.bulk_create([
+            Designer(name='Designer1'),
+            Designer(name='Designer2'),
+        ])
+        perfumes = create_perfumes(cls.user, 2)
+        # Link both perfumes to the designer with a single INSERT
+        through = Perfume.designers.through
+        through.objects.bulk_create([
+            through(perfume_id=perfume.id, designer_id=cls.designer1.id)
+            for perfume in perfumes
+        ])
 
     def setUp(self):
-        self.user = create_user()
-        self.client = APIClient()
         self.client.force_authenticate(self.user)
 
     def test_retrieve_designers(self):
         """Test retrieving a list of designers."""
-        Designer.objects.create(name='Christian Dior')
-        Designer.objects.create(name='Jean Claude Ellena')
+        Designer.objects.bulk_create([
+            Designer(name='Christian Dior'),
+            Designer(name='Jean Claude Ellena'),
+        ])
 
         res = self.client.get(DESIGNERS_URL)
 
         designers = Designer.objects.all().order_by('-name')
-        # many=True --> list of objects
-        serializer = DesignerSerializer(designers, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(
+            [(d['id'], d['name']) for d in res.data],
+            list(designers.values_list('id', 'name')),
+        )
 
     def test_update_designer(self):
         """Test updating a designer."""
@@ -71,6 +92,20 @@ class PrivateDesignersApiTests(TestCase):
         designer.refresh_from_db()
         self.assertEqual(designer.name, payload['name'])
 
+    def test_update_designer_duplicate_name_error(self):
+        """Test renaming a designer to an existing name fails."""
+        designer, _ = Designer.objects.bulk_create([
+            Designer(name='Sofia Grojhman'),
+            Designer(name='Sofia Grojsman'),
+        ])
+
+        payload = {'name': 'Sofia Grojsman'}
+        res = self.client.patch(detail_url(designer.id), payload)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        designer.refresh_from_db()
+        self.assertEqual(designer.name, 'Sofia Grojhman')
+
     def test_delete_designer(self):
         """Test deleting a designer."""
         designer = Designer.objects.create(name='Calvin Klein')
@@ -79,62 +114,20 @@ class PrivateDesignersApiTests(TestCase):
         res = self.client.delete(url)
 
         self.assertEqual(res.status_code, status.HTTP_204_NO_CONTENT)
-        designers = Designer.objects.all()
+        designers = Designer.objects.filter(id=designer.id)
         self.assertFalse(designers.exists())
 
     def test_filter_designers_assigned_to_perfumes(self):
         """Test listing designers to those assigned to perfumes."""
-        designer1 = Designer.objects.create(name='Designer1')
-        designer2 = Designer.objects.create(name='Designer2')
-        perfume = Perfume.objects.create(
-            user=self.user,
-            title='Sample perfume name',
-            rating=Decimal('5.50'),
-            number_of_votes=2500,
-            gender=0,
-            longevity=Decimal('6.1'),
-            sillage=Decimal('4.2'),
-            price_value=Decimal('7.0'),
-            description="Perfume description.",
-        )
-        perfume.designers.add(designer1)
-
         res = self.client.get(DESIGNERS_URL, {'assigned_only': 1})
 
-        s1 = DesignerSerializer(designer1)
-        s2 = DesignerSerializer(designer2)
+        s1 = DesignerSerializer(self.designer1)
+        s2 = DesignerSerializer(self.designer2)
         self.assertIn(s1.data, res.data)
         self.assertNotIn(s2.data, res.data)
 
     def test_filtered_designers_unique(self):
         """Test filtered designers returns a unique list."""
-        designer = Designer.objects.create(name='Designer1')
-        Designer.objects.create(name='Designer2')
-        perfume1 = Perfume.objects.create(
-            user=self.user,
-            title='Sample perfume name',
-            rating=Decimal('5.50'),
-            number_of_votes=2500,
-            gender=0,
-            longevity=Decimal('6.1'),
-            sillage=Decimal('4.2'),
-            price_value=Decimal('7.0'),
-            description="Perfume description.",
-        )
-        perfume2 = Perfume.objects.create(
-            user=self.user,
-            title='Sample perfume name',
-            rating=Decimal('5.50'),
-            number_of_votes=2500,
-            gender=0,
-            longevity=Decimal('6.1'),
-            sillage=Decimal('4.2'),
-            price_value=Decimal('7.0'),
-            description="Perfume description.",
-        )
-        perfume1.designers.add(designer)
-        perfume2.designers.add(designer)
-
         """
         When the request is made with the query parameter {'assigned_only': 1}, it should only 
         return a single DESIGNER (ing) since it is the only one that is assigned to a recipe.
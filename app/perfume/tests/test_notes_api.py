@@ -1,21 +1,24 @@
 """
 Tests for the notes API.
 """
+from functools import lru_cache
+
 from django.contrib.auth import get_user_model
 from django.urls import reverse
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from base.models import Note, Perfume
+from base.models import Note
 from perfume.serializers import NoteSerializer
+from perfume.tests.factories import create_perfume, create_perfumes
 
-from decimal import Decimal
-
+User = get_user_model()
 NOTES_URL = reverse('perfume:note-list')
 
 
+@lru_cache(maxsize=None)
 def detail_url(note_id):
     """Create and return a note detail url."""
     return reverse('perfume:note-detail', args=[note_id])
@@ -23,14 +26,13 @@ def detail_url(note_id):
 
 def create_user(email='user@example.com', password='testpass123'):
     """Create and return a user."""
-    return get_user_model().objects.create_user(email=email, password=password)
+    return User.objects.create_user(email=email, password=password)
 
 
-class PublicNotesApiTests(TestCase):
+class PublicNotesApiTests(SimpleTestCase):
     """Test unauthenticated API requests."""
-
-    def setUp(self):
-        self.client = APIClient()
+    # The 401 is returned before any query, so no transaction is needed
+    client_class = APIClient
 
     def test_auth_required(self):
         """Test auth is required for retrieving tags."""
@@ -40,24 +42,28 @@ class PublicNotesApiTests(TestCase):
 
 class PrivateNotesApiTests(TestCase):
     """Test authenticated API requests."""
+    client_class = APIClient
+
+    @classmethod
+    def setUpTestData(cls):
+        # Created once for the whole class instead of before every test
+        cls.user = create_user()
 
     def setUp(self):
-        self.user = create_user()
-        self.client = APIClient()
         self.client.force_authenticate(self.user)
 
     def test_retrieve_notes(self):
         """Test retrieving a list of notes."""
-        Note.objects.create(name='Hedione', type=1)
-        Note.objects.create(name='Vetiver', type=0)
+        Note.objects.bulk_create([
+            Note(name='Hedione', type=1),
+            Note(name='Vetiver', type=0),
+        ])
 
         res = self.client.get(NOTES_URL)
 
-        notes = Note.objects.all().order_by('-name')
-        # many=True --> list of objects
-        serializer = NoteSerializer(notes, many=True)
+        expected = Note.objects.order_by('-name').values('id', 'name', 'type')
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual([dict(n) for n in res.data], list(expected))
 
     def test_update_notes(self):
         """Test updating a note."""
@@ -68,9 +74,21 @@ class PrivateNotesApiTests(TestCase):
         res = self.client.patch(url, payload)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        note.refresh_from_db()
+        note.refresh_from_db(fields=['name'])
         self.assertEqual(note.name, payload['name'])
 
+    def test_update_note_duplicate_error(self):
+        """Test changing a note into an existing name and type fails."""
+        note = Note.objects.create(name='Vanillin', type=0)
+        Note.objects.create(name='Ethyl Maltol', type=0)
+
+        payload = {'name': 'Ethyl Maltol'}
+        res = self.client.patch(detail_url(note.id), payload)
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        note.refresh_from_db()
+        self.assertEqual(note.name, 'Vanillin')
+
     def test_delete_note(self):
         """Test deleting a note."""
         note = Note.objects.create(name='Galaxolide', type=0)
@@ -84,19 +102,11 @@ class PrivateNotesApiTests(TestCase):
 
     def test_filter_notes_assigned_to_perfumes(self):
         """Test listing notes to those assigned to perfumes."""
-        note1 = Note.objects.create(name='Note 1', type=0)
-        note2 = Note.objects.create(name='Note 2', type=1)
-        perfume = Perfume.objects.create(
-            user=self.user,
-            title='Sample perfume name',
-            rating=Decimal('5.50'),
-            number_of_votes=2500,
-            gender=0,
-            longevity=Decimal('6.1'),
-            sillage=Decimal('4.2'),
-            price_value=Decimal('7.0'),
-            description="Perfume description.",
-        )
+        note1, note2 = Note.objects.bulk_create([
+            Note(name='Note 1', type=0),
+            Note(name='Note 2', type=1),
+        ])
+        perfume = create_perfume(self.user)
         perfume.notes.add(note1)
         # Filter only notes that are assigned to a perfume
         # we have assigned 1 note this one should be returned
@@ -109,38 +119,29 @@ class PrivateNotesApiTests(TestCase):
         self.assertIn(s1.data, res.data)
         self.assertNotIn(s2.data, res.data)
 
+    def test_filter_notes_assigned_only_invalid_value(self):
+        """Test an unknown assigned_only value lists every note."""
+        Note.objects.create(name='Note 1', type=0)
+
+        res = self.client.get(NOTES_URL, {'assigned_only': 'abc'})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 1)
+
     def test_filtered_notes_unique(self):
         """Test filtered notes returns a unique list.
         We assign one note to 2 recipes and make sure that the API
         returns only one result (unique)
         """
-        note1 = Note.objects.create(name='Note 1', type=0)
-        Note.objects.create(name='Note 2', type=1)
-        perfume1 = Perfume.objects.create(
-            user=self.user,
-            title='Sample perfume name',
-            rating=Decimal('5.50'),
-            number_of_votes=2500,
-            gender=0,
-            longevity=Decimal('6.1'),
-            sillage=Decimal('4.2'),
-            price_value=Decimal('7.0'),
-            description="Perfume description.",
-        )
-        perfume2 = Perfume.objects.create(
-            user=self.user,
-            title='Sample perfume name',
-            rating=Decimal('5.50'),
-            number_of_votes=2500,
-            gender=0,
-            longevity=Decimal('6.1'),
-            sillage=Decimal('4.2'),
-            price_value=Decimal('7.0'),
-            description="Perfume description.",
-        )
-        perfume1.notes.add(note1)
-        perfume2.notes.add(note1)
-
-        res = self.client.get(NOTES_URL, {'assigned_only': 1})
-
-        self.assertEqual(len(res.data), 1)
+        note1, _ = Note.objects.bulk_create([
+            Note(name='Note 1', type=0),
+            Note(name='Note 2', type=1),
+        ])
+        perfume1, perfume2 = create_perfumes(self.user, 2)
+        # Link the note to both perfumes with a single INSERT
+        note1.perfume_set.add(perfume1, perfume2)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(NOTES_URL, {'assigned_only': 1})
+
+        self.assertEqual([n['id'] for n in res.data], [note1.id])
@@ -1,29 +1,50 @@
 """
 Tests for recipe APIs.
 """
-from decimal import Decimal
-import tempfile
+import io
+import json
 import os
+from functools import lru_cache
 
 from PIL import Image
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase
 from django.urls import reverse
 
 from rest_framework import status
 from rest_framework.test import APIClient
 
-from base.models import Perfume, Designer, Note
+from base.models import (
+    Perfume,
+    Designer,
+    Note,
+    perfume_thumbnail_file_path,
+)
 
 from perfume.serializers import (
     PerfumeSerializer,
     PerfumeDetailSerializer,
 )
+from perfume.views import PerfumePagination
+from perfume.tests.factories import (
+    PERFUME_DEFAULTS,
+    create_perfume,
+    create_perfumes,
+)
 
+User = get_user_model()
 PERFUMES_URL = reverse('perfume:perfume-list')
+# Plain columns of the list response, comparable with .values()
+LIST_FIELDS = [
+    field for field in PerfumeSerializer.Meta.fields
+    if field not in ('designers', 'notes')
+]
 
 
+@lru_cache(maxsize=None)
 def detail_url(perfume_id):
     """Create and return a recipe detail URL.
     http://localhost/api/perfume/1/
@@ -31,6 +52,7 @@ def detail_url(perfume_id):
     return reverse('perfume:perfume-detail', args=[perfume_id])
 
 
+@lru_cache(maxsize=None)
 def image_upload_url(perfume_id):
     """Create and return an image upload URL.
     /api/perfumes/<id>/upload-image/
@@ -38,39 +60,55 @@ def image_upload_url(perfume_id):
     return reverse('perfume:perfume-upload-image', args=[perfume_id])
 
 
-def create_perfume(user, **params):
-    """Create and return a record in perfume database.
-    Helper function to create perfume record for the tests
+def json_payload(**fields):
+    """Return a perfume create payload and its JSON encoded body.
+    Used for module constants, so each body is encoded only once.
     """
-    defaults = {
-        'title': 'Sample perfume name',
-        'rating': Decimal('5.50'),
-        'number_of_votes': 2500,
-        'gender': 0,
-        'longevity': Decimal('6.1'),
-        'sillage': Decimal('4.2'),
-        'price_value': Decimal('7.0'),
-        'description': "Perfume description.",
-    }
-    # This updates the defaults with any values,
-    # provided in params (if we provide any)
-    # if we do not provide any params it will use the defaults
-    defaults.update(params)
-
-    perfume = Perfume.objects.create(user=user, **defaults)
-    return perfume
+    payload = {**PERFUME_DEFAULTS, **fields}
+    return payload, json.dumps(payload).encode()
+
+
+NEW_DESIGNERS_PAYLOAD, NEW_DESIGNERS_BODY = json_payload(
+    designers=[{'name': 'Christian Dion'}, {'name': 'Bulgari'}],
+)
+EXISTING_DESIGNERS_PAYLOAD, EXISTING_DESIGNERS_BODY = json_payload(
+    designers=[{'name': 'Christian Dion'}, {'name': 'Designer 1'}],
+)
+NEW_NOTES_PAYLOAD, NEW_NOTES_BODY = json_payload(
+    notes=[{'name': 'Patchouli', 'type': 0},
+           {'name': 'Rose Oil', 'type': 1}],
+)
+EXISTING_NOTES_PAYLOAD, EXISTING_NOTES_BODY = json_payload(
+    notes=[{'name': 'Romandolide', 'type': 0},
+           {'name': 'Olibanum', 'type': 1}],
+)
+
+
+def make_jpeg_bytes():
+    """Return a basic test image, black 10 by 10 pixels, as JPEG."""
+    buffer = io.BytesIO()
+    Image.new('RGB', (10, 10)).save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+# Encoded once, every upload test wraps the same bytes
+JPEG_BYTES = make_jpeg_bytes()
+
+
+def list_rows(data):
+    """Return the LIST_FIELDS of each perfume in a list response."""
+    return [{field: row[field] for field in LIST_FIELDS} for row in data]
 
 
 def create_user(**params):
     """Create and return a new user."""
-    return get_user_model().objects.create_user(**params)
+    return User.objects.create_user(**params)
 
 
-class PublicPerfumeAPITests(TestCase):
+class PublicPerfumeAPITests(SimpleTestCase):
     """Test unauthenticated API requests."""
-
-    def setUp(self):
-        self.client = APIClient()
+    # The 401 is returned before any query, so no transaction is needed
+    client_class = APIClient
 
     def test_auth_required(self):
         """Test auth is required to call API."""
@@ -78,33 +116,95 @@ class PublicPerfumeAPITests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
+class PerfumeSerializerTests(SimpleTestCase):
+    """Test perfume serializer rules that don't need the database."""
+
+    def test_update_user_is_ignored(self):
+        """Test the perfume user can't be changed through the API.
+        user isn't a serializer field, so a submitted user never
+        reaches validated_data and update() can't change the owner.
+        """
+        serializer = PerfumeDetailSerializer(data={'user': 2}, partial=True)
+
+        self.assertTrue(serializer.is_valid())
+        self.assertNotIn('user', serializer.validated_data)
+
+
 class PrivatePerfumeApiTests(TestCase):
     """Test authenticated API requests."""
+    client_class = APIClient
 
-    def setUp(self):
-        self.client = APIClient()
-        self.user = create_user(
+    @classmethod
+    def setUpTestData(cls):
+        # Created once for the whole class instead of before every test
+        cls.user = create_user(
             email='user@example.com',
             password='testpass123',
         )
+        # Designers and notes that exist before a test runs, by name
+        cls.designers = {
+            designer.name: designer
+            for designer in Designer.objects.bulk_create([
+                Designer(name='Designer 1'),
+                Designer(name='Designer One'),
+                Designer(name='Designer Two'),
+                Designer(name='Karl Lagerfelt'),
+            ])
+        }
+        cls.notes = {
+            note.name: note
+            for note in Note.objects.bulk_create([
+                Note(name='Olibanum', type=1),
+                Note(name='Labdanum', type=0),
+                Note(name='Vetiver', type=0),
+                Note(name='Ethyl Vanillin', type=0),
+            ])
+        }
+
+    def setUp(self):
         self.client.force_authenticate(self.user)
 
     def test_retrieve_perfumes(self):
         """Test retrieving a list of recipes."""
-        create_perfume(user=self.user)
+        create_perfumes(self.user, 2)
+
+        # Designers and notes come with the perfumes in a single query
+        with self.assertNumQueries(1):
+            res = self.client.get(PERFUMES_URL)
+
+        perfumes = Perfume.objects.order_by('-id')
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [row['id'] for row in res.data['results']],
+            list(perfumes.values_list('id', flat=True)),
+        )
+        # All rows share one shape, checking the first one is enough
+        self.assertEqual(
+            list_rows(res.data['results'][:1]),
+            list(perfumes.values(*LIST_FIELDS)[:1]),
+        )
+
+    def test_retrieve_perfumes_with_designers_and_notes(self):
+        """Test list returns the same nested data as the serializer."""
+        perfume = create_perfume(user=self.user)
+        perfume.designers.add(
+            # Created out of name order, both lists must sort them alike
+            Designer.objects.create(name='Bulgari'),
+            Designer.objects.create(name='Christian Dior'),
+        )
+        perfume.notes.add(Note.objects.create(name='Patchouli', type=0))
         create_perfume(user=self.user)
 
         res = self.client.get(PERFUMES_URL)
 
         perfumes = Perfume.objects.all().order_by('-id')
-        # many=True --> serializer will return a list of items
         serializer = PerfumeSerializer(perfumes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_perfume_list_limited_to_user(self):
         """Test list of recipes is limited to authenticated user."""
-        other_user = get_user_model().objects.create_user(
+        other_user = User.objects.create_user(
             'other@example.com',
             'password123',
         )
@@ -112,19 +212,35 @@ class PrivatePerfumeApiTests(TestCase):
         create_perfume(user=other_user)
         create_perfume(user=self.user)
 
+        with self.assertNumQueries(1):
+            res = self.client.get(PERFUMES_URL)
+
+        expected = Perfume.objects.filter(user=self.user).values(*LIST_FIELDS)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(list_rows(res.data['results']), list(expected))
+
+    def test_perfume_list_paginated(self):
+        """Test the list returns one page and a link to the next one."""
+        create_perfumes(self.user, PerfumePagination.page_size + 1)
+
         res = self.client.get(PERFUMES_URL)
 
-        recipes = Perfume.objects.filter(user=self.user)
-        serializer = PerfumeSerializer(recipes, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(
+            len(res.data['results']), PerfumePagination.page_size,
+        )
+        next_page = self.client.get(res.data['next'])
+        self.assertEqual(len(next_page.data['results']), 1)
+        self.assertIsNone(next_page.data['next'])
 
     def test_get_perfume_detail(self):
         """Test get recipe detail."""
         perfume = create_perfume(user=self.user)
 
         url = detail_url(perfume.id)
-        res = self.client.get(url)
+        # The perfume plus one prefetch each for designers and notes
+        with self.assertNumQueries(3):
+            res = self.client.get(url)
 
         # It is 1 recipe that's why we do not pass many=True
         serializer = PerfumeDetailSerializer(perfume)
@@ -132,33 +248,36 @@ class PrivatePerfumeApiTests(TestCase):
 
     def test_create_perfume(self):
         """Test creating a perfume."""
-        payload = {
-            'title': 'Sample perfume name',
-            'rating': Decimal('5.50'),
-            'number_of_votes': 2500,
-            'gender': 0,
-            'longevity': Decimal('6.1'),
-            'sillage': Decimal('4.2'),
-            'price_value': Decimal('7.0'),
-            'description': "Perfume description.",
-        }
+        payload = dict(PERFUME_DEFAULTS)
         res = self.client.post(PERFUMES_URL, payload)
 
         self.assertEqual(res.status_code, status.HTTP_201_CREATED)
         perfume = Perfume.objects.get(id=res.data['id'])
-        for key in payload.keys():
-            self.assertEqual(payload[key], getattr(perfume, key))
+        self.assertEqual({k: getattr(perfume, k) for k in payload}, payload)
+
+    def test_create_perfume_invalid_scores_error(self):
+        """Test NaN, infinity and out of range scores are rejected."""
+        for value in ['nan', 'inf', '12345.678', '-1']:
+            with self.subTest(value=value):
+                payload = {**PERFUME_DEFAULTS, 'rating': value}
+                res = self.client.post(PERFUMES_URL, payload)
+
+                self.assertEqual(res.status_code,
+                                 status.HTTP_400_BAD_REQUEST)
+                self.assertIn('rating', res.data)
+
+        self.assertFalse(Perfume.objects.exists())
 
     def test_partial_update(self):
         """Test partial update of perfume."""
         perfume = create_perfume(
             user=self.user,
-            rating=Decimal('5.50'),
+            rating=5.5,
             number_of_votes=2500,
         )
 
         payload = {
-            'rating': Decimal('5.10'),
+            'rating': 5.1,
             'number_of_votes': 3100,
         }
 
@@ -166,40 +285,39 @@ class PrivatePerfumeApiTests(TestCase):
         res = self.client.patch(url, payload)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        perfume.refresh_from_db()
+        perfume.refresh_from_db(fields=['rating', 'number_of_votes', 'user'])
         self.assertEqual(perfume.rating, payload['rating'])
         self.assertEqual(perfume.number_of_votes, payload['number_of_votes'])
-        self.assertEqual(perfume.user, self.user)
+        self.assertEqual(perfume.user_id, self.user.id)
 
     def test_full_update(self):
         """Test full update of perfume."""
         perfume = create_perfume(
             user=self.user,
-            rating=Decimal('5.50'),
+            rating=5.5,
             number_of_votes=2500,
         )
 
         payload = {
             'title': 'Fully updated perfume name',
-            'rating': Decimal('5.00'),
+            'rating': 5.0,
             'number_of_votes': 4300,
             'gender': 0,
-            'longevity': Decimal('6.0'),
-            'sillage': Decimal('4.0'),
-            'price_value': Decimal('6.0'),
+            'longevity': 6.0,
+            'sillage': 4.0,
+            'price_value': 6.0,
             'description': "Perfume updated description.",
         }
         url = detail_url(perfume.id)
         res = self.client.put(url, payload)
 
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        perfume.refresh_from_db()
-        for k, v in payload.items():
-            self.assertEqual(getattr(perfume, k), v)
-        self.assertEqual(perfume.user, self.user)
+        perfume.refresh_from_db(fields=[*payload, 'user'])
+        self.assertEqual({k: getattr(perfume, k) for k in payload}, payload)
+        self.assertEqual(perfume.user_id, self.user.id)
 
     def test_update_user_returns_error(self):
-        """Test changing the perfume user results in an error."""
+        """Test changing the perfume user through the API is ignored."""
         new_user = create_user(email='user2@example.com', password='test123')
         perfume = create_perfume(user=self.user)
 
@@ -234,57 +352,41 @@ class PrivatePerfumeApiTests(TestCase):
 
     def test_perfume_with_new_designers(self):
         """Test creating a perfume with new designers."""
-        payload = {
-            'title': 'Sample perfume name',
-            'rating': Decimal('5.50'),
-            'number_of_votes': 2500,
-            'gender': 0,
-            'longevity': Decimal('6.1'),
-            'sillage': Decimal('4.2'),
-            'price_value': Decimal('7.0'),
-            'description': "Perfume description.",
-            'designers': [{'name': 'Christian Dion'}, {'name': 'Bulgari'}],
-        }
-        res = self.client.post(PERFUMES_URL, payload, format='json')
+        payload = NEW_DESIGNERS_PAYLOAD
+        # Savepoint pair, perfume INSERT, designers lookup, INSERT and
+        # re-lookup, one through table INSERT and the two response reads
+        with self.assertNumQueries(9):
+            res = self.client.post(
+                PERFUMES_URL,
+                NEW_DESIGNERS_BODY,
+                content_type='application/json',
+            )
 
         self.assertEqual(res.status_code, status.HTTP_201_CREATED)
-        perfumes = Perfume.objects.filter(user=self.user)
-        self.assertEqual(perfumes.count(), 1)
-        perfume = perfumes[0]
-        self.assertEqual(perfume.designers.count(), 2)
-        for designer in payload['designers']:
-            exists = perfume.designers.filter(
-                name=designer['name'],
-            ).exists()
-            self.assertTrue(exists)
+        # get() also fails if the user does not have exactly one perfume
+        perfume = Perfume.objects.get(user=self.user)
+        self.assertEqual(
+            set(perfume.designers.values_list('name', flat=True)),
+            {designer['name'] for designer in payload['designers']},
+        )
 
     def test_create_perfume_with_existing_designers(self):
         """Test creating a recipe with existing designer."""
-        designer_1 = Designer.objects.create(name='Designer 1')
-        payload = {
-            'title': 'Sample perfume name',
-            'rating': Decimal('5.50'),
-            'number_of_votes': 2500,
-            'gender': 0,
-            'longevity': Decimal('6.1'),
-            'sillage': Decimal('4.2'),
-            'price_value': Decimal('7.0'),
-            'description': "Perfume description.",
-            'designers': [{'name': 'Christian Dion'}, {'name': 'Designer 1'}],
-        }
-        res = self.client.post(PERFUMES_URL, payload, format='json')
+        payload = EXISTING_DESIGNERS_PAYLOAD
+        res = self.client.post(
+            PERFUMES_URL,
+            EXISTING_DESIGNERS_BODY,
+            content_type='application/json',
+        )
 
         self.assertEqual(res.status_code, status.HTTP_201_CREATED)
-        perfumes = Perfume.objects.filter(user=self.user)
-        self.assertEqual(perfumes.count(), 1)
-        perfume = perfumes[0]
-        self.assertEqual(perfume.designers.count(), 2)
-        self.assertIn(designer_1, perfume.designers.all())
-        for designer in payload['designers']:
-            exists = perfume.designers.filter(
-                name=designer['name'],
-            ).exists()
-            self.assertTrue(exists)
+        # get() also fails if the user does not have exactly one perfume
+        perfume = Perfume.objects.get(user=self.user)
+        self.assertIn(self.designers['Designer 1'], perfume.designers.all())
+        self.assertEqual(
+            set(perfume.designers.values_list('name', flat=True)),
+            {designer['name'] for designer in payload['designers']},
+        )
 
     def test_create_designer_on_update(self):
         """Test create designer when updating a perfume."""
@@ -300,11 +402,11 @@ class PrivatePerfumeApiTests(TestCase):
 
     def test_update_perfume_assign_designer(self):
         """Test assigning an existing designer when updating a perfume."""
-        designer_one = Designer.objects.create(name='Designer One')
+        designer_one = self.designers['Designer One']
         perfume = create_perfume(user=self.user)
         perfume.designers.add(designer_one)
 
-        designer_two = Designer.objects.create(name='Designer Two')
+        designer_two = self.designers['Designer Two']
         payload = {'designers': [{'name': 'Designer Two'}]}
         url = detail_url(perfume.id)
         res = self.client.patch(url, payload, format='json')
@@ -315,7 +417,7 @@ class PrivatePerfumeApiTests(TestCase):
 
     def test_clear_perfume_designers(self):
         """Test clearing a perfume designers."""
-        designer = Designer.objects.create(name='Karl Lagerfelt')
+        designer = self.designers['Karl Lagerfelt']
         perfume = create_perfume(user=self.user)
         perfume.designers.add(designer)
 
@@ -328,61 +430,38 @@ class PrivatePerfumeApiTests(TestCase):
 
     def test_perfume_with_new_notes(self):
         """Test creating a perfume with new notes."""
-        payload = {
-            'title': 'Sample perfume name',
-            'rating': Decimal('5.50'),
-            'number_of_votes': 2500,
-            'gender': 0,
-            'longevity': Decimal('6.1'),
-            'sillage': Decimal('4.2'),
-            'price_value': Decimal('7.0'),
-            'description': "Perfume description.",
-            'notes': [{'name': 'Patchouli', 'type': 0},
-                      {'name': 'Rose Oil', 'type': 1}],
-        }
-        res = self.client.post(PERFUMES_URL, payload, format='json')
+        payload = NEW_NOTES_PAYLOAD
+        res = self.client.post(
+            PERFUMES_URL,
+            NEW_NOTES_BODY,
+            content_type='application/json',
+        )
 
         self.assertEqual(res.status_code, status.HTTP_201_CREATED)
-        perfumes = Perfume.objects.filter(user=self.user)
-        self.assertEqual(perfumes.count(), 1)
-        perfume = perfumes[0]
-        self.assertEqual(perfume.notes.count(), 2)
-        for note in payload['notes']:
-            exists = perfume.notes.filter(
-                name=note['name'],
-                type=note['type'],
-            ).exists()
-            self.assertTrue(exists)
+        # get() also fails if the user does not have exactly one perfume
+        perfume = Perfume.objects.get(user=self.user)
+        self.assertEqual(
+            set(perfume.notes.values_list('name', 'type')),
+            {(note['name'], note['type']) for note in payload['notes']},
+        )
 
     def test_create_perfume_with_existing_notes(self):
         """Test creating a perfume with existing note."""
-        note_1 = Note.objects.create(name='Olibanum', type=1)
-        payload = {
-            'title': 'Sample perfume name',
-            'rating': Decimal('5.50'),
-            'number_of_votes': 2500,
-            'gender': 0,
-            'longevity': Decimal('6.1'),
-            'sillage': Decimal('4.2'),
-            'price_value': Decimal('7.0'),
-            'description': "Perfume description.",
-            'notes': [{'name': 'Romandolide', 'type': 0},
-                      {'name': 'Olibanum', 'type': 1}],
-        }
-        res = self.client.post(PERFUMES_URL, payload, format='json')
+        payload = EXISTING_NOTES_PAYLOAD
+        res = self.client.post(
+            PERFUMES_URL,
+            EXISTING_NOTES_BODY,
+            content_type='application/json',
+        )
 
         self.assertEqual(res.status_code, status.HTTP_201_CREATED)
-        perfumes = Perfume.objects.filter(user=self.user)
-        self.assertEqual(perfumes.count(), 1)
-        perfume = perfumes[0]
-        self.assertEqual(perfume.notes.count(), 2)
-        self.assertIn(note_1, perfume.notes.all())
-        for note in payload['notes']:
-            exists = perfume.notes.filter(
-                name=note['name'],
-                type=note['type'],
-            ).exists()
-            self.assertTrue(exists)
+        # get() also fails if the user does not have exactly one perfume
+        perfume = Perfume.objects.get(user=self.user)
+        self.assertIn(self.notes['Olibanum'], perfume.notes.all())
+        self.assertEqual(
+            set(perfume.notes.values_list('name', 'type')),
+            {(note['name'], note['type']) for note in payload['notes']},
+        )
 
     def test_create_note_on_update(self):
         """Test create note when updating a perfume."""
@@ -398,11 +477,11 @@ class PrivatePerfumeApiTests(TestCase):
 
     def test_update_perfume_assign_note(self):
         """Test assigning an existing note when updating a perfume."""
-        note_one = Note.objects.create(name='Patchouli', type=0)
+        note_one = self.notes['Labdanum']
         perfume = create_perfume(user=self.user)
         perfume.notes.add(note_one)
 
-        note_two = Note.objects.create(name='Vetiver', type=0)
+        note_two = self.notes['Vetiver']
         payload = {'notes': [{'name': 'Vetiver', 'type': 0}]}
         url = detail_url(perfume.id)
         res = self.client.patch(url, payload, format='json')
@@ -413,7 +492,7 @@ class PrivatePerfumeApiTests(TestCase):
 
     def test_clear_perfume_notes(self):
         """Test clearing a perfume notes."""
-        note = Note.objects.create(name='Ethyl Vanillin', type=0)
+        note = self.notes['Ethyl Vanillin']
         perfume = create_perfume(user=self.user)
         perfume.notes.add(note)
 
@@ -426,88 +505,186 @@ class PrivatePerfumeApiTests(TestCase):
 
     def test_filter_by_designers(self):
         """Test filtering perfumes by designers."""
-        p1 = create_perfume(user=self.user, title='Perufme 1')
-        p2 = create_perfume(user=self.user, title='Perfume 2')
-        designer1 = Designer.objects.create(name='Designer 1')
-        designer2 = Designer.objects.create(name='Designer 2')
-        p1.designers.add(designer1)
-        p2.designers.add(designer2)
-        p3 = create_perfume(user=self.user, title='Perfume 3')
+        p1, p2, p3 = create_perfumes(self.user, 3)
+        designer1, designer2 = Designer.objects.bulk_create([
+            Designer(name='Designer A'),
+            Designer(name='Designer B'),
+        ])
+        # Both links are written with a single INSERT
+        through = Perfume.designers.through
+        through.objects.bulk_create([
+            through(perfume_id=p1.id, designer_id=designer1.id),
+            through(perfume_id=p2.id, designer_id=designer2.id),
+        ])
 
         params = {'designers': f'{designer1.id},{designer2.id}'}
         res = self.client.get(PERFUMES_URL, params)
 
-        s1 = PerfumeSerializer(p1)
-        s2 = PerfumeSerializer(p2)
-        s3 = PerfumeSerializer(p3)
-        self.assertIn(s1.data, res.data)
-        self.assertIn(s2.data, res.data)
-        self.assertNotIn(s3.data, res.data)
+        # p3 has none of the requested ones and must be left out
+        self.assertEqual(
+            {row['id'] for row in res.data['results']},
+            {p1.id, p2.id},
+        )
+
+    def test_filter_by_designers_unique(self):
+        """Test a perfume matching several designers is listed once."""
+        perfume = create_perfume(user=self.user)
+        designer1 = self.designers['Designer One']
+        designer2 = self.designers['Designer Two']
+        perfume.designers.add(designer1, designer2)
+
+        params = {'designers': f'{designer1.id},{designer2.id}'}
+        res = self.client.get(PERFUMES_URL, params)
+
+        self.assertEqual([row['id'] for row in res.data['results']],
+                         [perfume.id])
+
+    def test_filter_invalid_ids_returns_error(self):
+        """Test filtering with malformed IDs is a bad request."""
+        for params in ({'designers': '1,abc'}, {'notes': '1,,2'}):
+            res = self.client.get(PERFUMES_URL, params)
+
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
     def test_filter_by_notes(self):
         """Test filtering perfumes by notes."""
-        p1 = create_perfume(user=self.user, title='Perufme 1')
-        p2 = create_perfume(user=self.user, title='Perfume 2')
-        note1 = Note.objects.create(name='Note 1', type=0)
-        note2 = Note.objects.create(name='Note 2', type=1)
-        p1.notes.add(note1)
-        p2.notes.add(note2)
-        p3 = create_perfume(user=self.user, title='Perfume 3')
+        p1, p2, p3 = create_perfumes(self.user, 3)
+        note1, note2 = Note.objects.bulk_create([
+            Note(name='Note 1', type=0),
+            Note(name='Note 2', type=1),
+        ])
+        # Both links are written with a single INSERT
+        through = Perfume.notes.through
+        through.objects.bulk_create([
+            through(perfume_id=p1.id, note_id=note1.id),
+            through(perfume_id=p2.id, note_id=note2.id),
+        ])
 
         params = {'notes': f'{note1.id},{note2.id}'}
         res = self.client.get(PERFUMES_URL, params)
 
-        s1 = PerfumeSerializer(p1)
-        s2 = PerfumeSerializer(p2)
-        s3 = PerfumeSerializer(p3)
-        self.assertIn(s1.data, res.data)
-        self.assertIn(s2.data, res.data)
-        self.assertNotIn(s3.data, res.data)
+        # p3 has none of the requested ones and must be left out
+        self.assertEqual(
+            {row['id'] for row in res.data['results']},
+            {p1.id, p2.id},
+        )
 
 
 class ImageUploadTests(TestCase):
     """Tests for the image upload API."""
+    client_class = APIClient
 
-    def setUp(self):
-        self.client = APIClient()
-        self.user = get_user_model().objects.create_user(
+    @classmethod
+    def setUpTestData(cls):
+        # Each test gets its own copy of these objects
+        cls.user = User.objects.create_user(
             'user@example.com',
             'password123',
         )
+        cls.perfume = create_perfume(user=cls.user)
+
+    def setUp(self):
         self.client.force_authenticate(self.user)
-        self.perfume = create_perfume(user=self.user)
 
     def tearDown(self):
+        if self.perfume.image:
+            default_storage.delete(
+                perfume_thumbnail_file_path(self.perfume.image.name),
+            )
         self.perfume.image.delete()
 
     def test_upload_image(self):
         """Test uploading an image to a perfume."""
         url = image_upload_url(self.perfume.id)
-        """
-        This is a helper module that's provided by Python, which allows you to create 
-        temporary files when you're working with Python code.        
-        So while we're in this block that says with tempfile.NamedTemporaryFile
-        as image file, all the code that's in here, it's going to have a temporary file 
-        created that we can use. And then as soon as this ends, it's going to clean up, 
-        file out for us all nicely. So we're using this name temporary file to create a 
-        temporary image file that we can use to test uploading to our endpoint.
-        """
-        with tempfile.NamedTemporaryFile(suffix='.jpg') as image_file:
-            # Creates basic test image, black 10 by 10 pixels
-            img = Image.new('RGB', (10, 10))
-            # Save file to file system
-            img.save(image_file, format='JPEG')
-            # seeks back to the beginning of the file because
-            # img.save() moves pointer to the end of the file
-            image_file.seek(0)
-            payload = {'image': image_file}
-            # format='multipart' contains text and binary data
-            res = self.client.post(url, payload, format='multipart')
+        # A fresh in-memory file around the image encoded at import
+        image_file = SimpleUploadedFile(
+            'image.jpg', JPEG_BYTES, content_type='image/jpeg',
+        )
+        payload = {'image': image_file}
+        # format='multipart' contains text and binary data
+        res = self.client.post(url, payload, format='multipart')
 
         self.perfume.refresh_from_db()
         self.assertEqual(res.status_code, status.HTTP_200_OK)
         self.assertIn('image', res.data)
         self.assertTrue(os.path.exists(self.perfume.image.path))
+        thumb_path = perfume_thumbnail_file_path(self.perfume.image.path)
+        self.assertTrue(os.path.exists(thumb_path))
+        self.assertEqual(
+            self.perfume.image_thumb_url,
+            default_storage.url(
+                perfume_thumbnail_file_path(self.perfume.image.name),
+            ),
+        )
+
+    def test_upload_png_image_thumbnail_is_jpeg(self):
+        """Test thumbnails of other formats are stored as JPEG."""
+        buffer = io.BytesIO()
+        Image.new('RGBA', (10, 10)).save(buffer, format='PNG')
+        image_file = SimpleUploadedFile(
+            'image.png', buffer.getvalue(), content_type='image/png',
+        )
+        url = image_upload_url(self.perfume.id)
+        res = self.client.post(url, {'image': image_file},
+                               format='multipart')
+
+        self.perfume.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        thumb_path = perfume_thumbnail_file_path(self.perfume.image.path)
+        with Image.open(thumb_path) as thumb:
+            self.assertEqual(thumb.format, 'JPEG')
+
+    def upload_old_image(self):
+        """Upload an image to be replaced, its files are removed
+        after the test.
+        """
+        image_file = SimpleUploadedFile(
+            'old.jpg', JPEG_BYTES, content_type='image/jpeg',
+        )
+        self.client.post(image_upload_url(self.perfume.id),
+                         {'image': image_file}, format='multipart')
+        self.perfume.refresh_from_db()
+        name = self.perfume.image.name
+        self.addCleanup(default_storage.delete, name)
+        self.addCleanup(default_storage.delete,
+                        perfume_thumbnail_file_path(name))
+        return self.perfume.image_thumb_url
+
+    def test_update_image_regenerates_thumbnail(self):
+        """Test changing the image on the detail endpoint
+        replaces the thumbnail.
+        """
+        old_thumb_url = self.upload_old_image()
+        old_thumb_path = perfume_thumbnail_file_path(self.perfume.image.path)
+        image_file = SimpleUploadedFile(
+            'new.jpg', JPEG_BYTES, content_type='image/jpeg',
+        )
+        res = self.client.patch(detail_url(self.perfume.id),
+                                {'image': image_file}, format='multipart')
+
+        self.perfume.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(self.perfume.image_thumb_url, old_thumb_url)
+        self.assertFalse(os.path.exists(old_thumb_path))
+        self.assertEqual(
+            self.perfume.image_thumb_url,
+            default_storage.url(
+                perfume_thumbnail_file_path(self.perfume.image.name),
+            ),
+        )
+
+    def test_clear_image_clears_thumbnail(self):
+        """Test removing the image also removes the thumbnail URL."""
+        self.upload_old_image()
+        old_thumb_path = perfume_thumbnail_file_path(self.perfume.image.path)
+        res = self.client.patch(detail_url(self.perfume.id),
+                                {'image': None}, format='json')
+
+        self.perfume.refresh_from_db()
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertFalse(os.path.exists(old_thumb_path))
+        self.assertFalse(self.perfume.image)
+        self.assertEqual(self.perfume.image_thumb_url, '')
 
     def test_upload_image_bad_request(self):
         """Test uploading an invalid image."""
@@ -1,10 +1,17 @@
 """
 Views for the recipe APIs
 """
+import re
+
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db.models import Exists, OuterRef, Prefetch
 from rest_framework import viewsets, mixins, status
 from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
+from rest_framework.parsers import MultiPartParser
 from rest_framework.response import Response
 
 from base.models import Perfume, Designer, Note
@@ -23,6 +30,21 @@ to extend the auto generated schema that's created by Django rest spectacular.
 """
 
 
+# Filter values like "1,2,3"
+ID_LIST_RE = re.compile(r'\A\d+(?:,\d+)*\Z')
+# Query string values that enable assigned_only
+ASSIGNED_ONLY_TRUE = frozenset({'1', 'true', 'True'})
+
+
+class PerfumePagination(CursorPagination):
+    """Page through perfumes newest first.
+    The cursor points at the last id of the page, so every page is read
+    from the (user, -id) index no matter how deep the client pages.
+    """
+    ordering = '-id'
+    page_size = 50
+
+
 @extend_schema_view(
     list=extend_schema(
         parameters=[
@@ -45,26 +67,88 @@ class PerfumeViewSet(viewsets.ModelViewSet):
     # permission_classes = (IsAuthenticated,)
     authentication_classes = [TokenAuthentication]
     permission_classes = [IsAuthenticated]
+    pagination_class = PerfumePagination
+    # We map to serializer classes, not instances,
+    # DRF creates the instance itself
+    action_serializers = {
+        'list': serializers.PerfumeSerializer,
+        'upload_image': serializers.PerfumeImageSerializer,
+    }
 
     def _params_to_ints(self, qs):
-        """Convert a list of strings to integers."""
+        """Convert a comma separated string of IDs to integers.
+        Anything else is a client error (400), not a server error.
+        """
+        if not ID_LIST_RE.match(qs):
+            raise ValidationError('Expected a comma separated list of IDs.')
         return [int(str_id) for str_id in qs.split(',')]
 
-    def get_queryset(self):
-        """Retrieve perfumes for authenticated user."""
+    def _list_queryset(self):
+        """Postgres returns designers and notes as JSON
+        in the same query as the perfumes. Only the columns the
+        list serializer shows are loaded (no description or image).
+        The designers and notes filters are documented for list only.
+        """
+        queryset = self.queryset.with_nested_json().only(
+            'id', 'title', 'rating', 'number_of_votes', 'gender',
+            'longevity', 'sillage', 'price_value', 'image_thumb_url',
+        )
         designers = self.request.query_params.get('designers')
         notes = self.request.query_params.get('notes')
-        queryset = self.queryset
+        # EXISTS subqueries match each perfume at most once,
+        # unlike joins on the many-to-many tables, so the result
+        # doesn't need DISTINCT
         if designers:
             designer_ids = self._params_to_ints(designers)
-            queryset = queryset.filter(designers__id__in=designer_ids)
+            queryset = queryset.filter(Exists(
+                Perfume.designers.through.objects.filter(
+                    perfume_id=OuterRef('pk'),
+                    designer_id__in=designer_ids,
+                )
+            ))
         if notes:
             notes_ids = self._params_to_ints(notes)
-            queryset = queryset.filter(notes__id__in=notes_ids)
+            queryset = queryset.filter(Exists(
+                Perfume.notes.through.objects.filter(
+                    perfume_id=OuterRef('pk'),
+                    note_id__in=notes_ids,
+                )
+            ))
+        return queryset
+
+    def _detail_queryset(self):
+        """Load nested designers and notes with one query each
+        instead of two extra queries for every perfume.
+        """
+        return self.queryset.prefetch_related(
+            Prefetch('designers',
+                     queryset=Designer.objects.only('id', 'name')),
+            Prefetch('notes',
+                     queryset=Note.objects.only('id', 'name', 'type')),
+        )
+
+    def _upload_image_queryset(self):
+        """The upload only reads and writes the image columns.
+        save() on a deferred instance updates just these columns.
+        """
+        return self.queryset.only('id', 'image', 'image_thumb_url')
+
+    # Actions missing here (create, destroy) use the plain queryset
+    action_querysets = {
+        'list': _list_queryset,
+        'retrieve': _detail_queryset,
+        'update': _detail_queryset,
+        'partial_update': _detail_queryset,
+        'upload_image': _upload_image_queryset,
+    }
 
+    def get_queryset(self):
+        """Retrieve perfumes for authenticated user."""
+        build = self.action_querysets.get(self.action)
+        queryset = build(self) if build else self.queryset
         return queryset.filter(
             user=self.request.user
-        ).order_by('-id').distinct()
+        ).order_by('-id')
 
     def get_serializer_class(self):
         """Return the serializer class for request.
@@ -72,17 +156,9 @@ class PerfumeViewSet(viewsets.ModelViewSet):
         RecipeDetailSerializer. For that we need to override
         get_serializer_class()
         """
-        if self.action == 'list':
-            # We don't return serializers.PerfumeSerializer()
-            # but just serializers.PerfumeSerializer
-            # this method do not require instance of a class
-            # just reference
-            return serializers.PerfumeSerializer
-        elif self.action == 'upload_image':
-            return serializers.PerfumeImageSerializer
-
-        # If action is not list we will return RecipeDetailSerializer
-        return self.serializer_class
+        # Actions missing from action_serializers use
+        # PerfumeDetailSerializer
+        return self.action_serializers.get(self.action, self.serializer_class)
 
     def perform_create(self, serializer):
         """Create a new perfume."""
@@ -99,15 +175,28 @@ class PerfumeViewSet(viewsets.ModelViewSet):
     reverse('perfume:perfume-upload-image', args=[perfume_id])    
     """
 
-    @action(methods=['POST'], detail=True, url_path='upload-image')
+    @action(methods=['POST'], detail=True, url_path='upload-image',
+            parser_classes=[MultiPartParser])
     def upload_image(self, request, pk=None):
         """Upload an image to perfume."""
+        # Write the upload to a temporary file while it is received,
+        # instead of holding it in memory and copying it afterwards.
+        # This must happen before request.data is read.
+        request._request.upload_handlers = [
+            TemporaryFileUploadHandler(request._request),
+        ]
         perfume = self.get_object()
         serializer = self.get_serializer(perfume, data=request.data)
 
         if serializer.is_valid():
             serializer.save()
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            # Same body as serializer.data (id and absolute image URL),
+            # built directly instead of running the fields again
+            data = {
+                'id': perfume.id,
+                'image': request.build_absolute_uri(perfume.image.url),
+            }
+            return Response(data, status=status.HTTP_200_OK)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -131,25 +220,36 @@ class BaseAttrViewSet(mixins.DestroyModelMixin,
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        """Filter queryset to authenticated user.
+        """Return designers or notes, optionally only assigned ones.
+        Designers and notes are shared by all users (they have no
+        user field), so the list isn't filtered by user.
         if assigned_only is not set its default value will be 0
-        bool() will convert integer provide (1 or 0) to appropriate boolean
+        Only the values in ASSIGNED_ONLY_TRUE turn the filter on,
+        anything else (including junk) leaves it off.
         """
-        assigned_only = bool(
-            int(self.request.query_params.get('assigned_only', 0))
+        assigned_only = (
+            self.request.query_params.get('assigned_only', '0')
+            in ASSIGNED_ONLY_TRUE
         )
-        queryset = self.queryset
+        # .all() clones the class level queryset so its result cache
+        # is never shared between requests
+        queryset = self.queryset.all()
         # If assigned_only is True that we are going to apply another filter
         if assigned_only:
             """
-            Here, perfume is a foreign key field in the model for this queryset, 
-            and isnull is a field lookup that returns True if the related field 
-            is null and False otherwise. Therefore, perfume__isnull=False means 
-            we want to filter out the queryset where the perfume field is not null.
+            Keep only the rows linked to at least one perfume.
+            EXISTS on the perfume link table (designer_id or note_id
+            column) matches every row once, while joining the perfumes
+            would repeat a row per perfume and need DISTINCT.
             """
-            queryset = queryset.filter(perfume__isnull=False)
+            model = queryset.model
+            through = model.perfume_set.through
+            queryset = queryset.filter(Exists(through.objects.filter(
+                **{f'{model._meta.model_name}_id': OuterRef('pk')}
+            )))
 
-        return queryset.order_by('-name').distinct()
+        # Designer and Note are ordered by -name by default
+        return queryset
 
 
 class DesignerViewSet(BaseAttrViewSet):
@@ -5,9 +5,13 @@ from django.contrib.auth import (
     get_user_model,
     authenticate,
 )
-from django.utils.translation import gettext as _
+from django.utils.translation import gettext_lazy as _
 from rest_framework import serializers
 
+User = get_user_model()
+# Lazy, translated only when an error response is rendered
+AUTH_FAILED_MSG = _('Unable to authenticate with provided credentials.')
+
 
 class UserSerializer(serializers.ModelSerializer):
     """Serializer for the user object.
@@ -24,22 +28,27 @@ class UserSerializer(serializers.ModelSerializer):
         """
         Here we tell Django what should be passed to Serializer
         """
-        model = get_user_model()
+        model = User
         # The only fields that we allow user to change
         # we don't include is_active or is_staff
         fields = ('email', 'password', 'name')
         # 'password': {'write_only': --> user will be able to set password,
         # but it will not be returned over API response
-        extra_kwargs = {'password': {'write_only': True, 'min_length': 5}}
+        # 'email' must always be sent to create a user (PATCH stays
+        # partial), stated here instead of left to the model field
+        extra_kwargs = {
+            'password': {'write_only': True, 'min_length': 5},
+            'email': {'required': True},
+        }
 
     def create(self, validated_data):
         """Create and return a user with encrypted password.
-        We're overwriting the create method so that we can call get_user_model
+        We're overwriting the create method so that we can call the user model
         object to create and then pass in the already validated
         data from our sterilizer.
         If there is a validation error this method will not be called.
         """
-        return get_user_model().objects.create_user(**validated_data)
+        return User.objects.create_user(**validated_data)
 
     def update(self, instance, validated_data):
         """Update and return user.
@@ -50,13 +59,19 @@ class UserSerializer(serializers.ModelSerializer):
         # and them remove it from the dictionary
         password = validated_data.pop('password', None)
         # instance is the module instance that will be updated
-        user = super().update(instance, validated_data)
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        changed = list(validated_data)
 
         if password:
-            user.set_password(password)
-            user.save()
+            instance.set_password(password)
+            changed.append('password')
 
-        return user
+        # One UPDATE for the fields and the new password together,
+        # naming only the columns that were sent
+        if changed:
+            instance.save(update_fields=changed)
+        return instance
 
 
 class AuthTokenSerializer(serializers.Serializer):
@@ -80,10 +95,11 @@ class AuthTokenSerializer(serializers.Serializer):
             password=password,
         )
         if not user:
-            msg = _('Unable to authenticate with provided credentials.')
             # By raising this way the Error the View will get it and
             # return 404 error.
-            raise serializers.ValidationError(msg, code='authorization')
+            raise serializers.ValidationError(
+                AUTH_FAILED_MSG, code='authorization',
+            )
 
         attrs['user'] = user
         return attrs
@@ -3,7 +3,7 @@ Views for the user API.
 """
 from rest_framework import generics, authentication, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
-from rest_framework.settings import api_settings
+from rest_framework.renderers import JSONRenderer
 
 from user.serializers import (
     UserSerializer,
@@ -30,16 +30,14 @@ class CreateTokenView(ObtainAuthToken):
     credentials and generate the authentication token. This serializer is responsible for validating
     the user's input data and serializing the token data to be sent back to the user.
     The renderer_classes attribute specifies the rendering classes that should be used to
-    format the response data. The api_settings.DEFAULT_RENDERER_CLASSES is a default list of
-    renderer classes defined by Django REST framework that includes JSONRenderer,
-    BrowsableAPIRenderer, and AdminRenderer.
+    format the response data. Only JSONRenderer is used: the endpoint is called by clients
+    on every login, so there is no point in rendering the HTML browsable API page.
     When a user sends a POST request to the CreateTokenView endpoint with valid credentials,
     the view will authenticate the user and generate a new token. The token data will then be
-    serialized using the AuthTokenSerializer and returned to the user in the specified format,
-    which in this case would be JSON, HTML or Admin interface.
+    serialized using the AuthTokenSerializer and returned to the user as JSON.
     """
     serializer_class = AuthTokenSerializer
-    renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
+    renderer_classes = [JSONRenderer]
 
 
 class ManageUserView(generics.RetrieveUpdateAPIView):